@@ -5,8 +5,16 @@ import tempfile
 import re
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from http.cookiejar import DefaultCookiePolicy
 import uuid
-import xml.dom.minidom as minidom
+import copy
+import time
+import sqlite3
+import threading
+from contextlib import closing
+from lxml import etree
 from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for
 from werkzeug.utils import secure_filename
 from pathlib import Path
@@ -57,6 +65,70 @@ GOV_AGENCY_MAP = {
     'usda.gov': 'U.S. Department of Agriculture',
 }
 
+# Package parts the editor can modify; everything else in the .docx is
+# copied from the upload untouched when the document is downloaded
+EDITABLE_PARTS = ('word/endnotes.xml', 'word/_rels/endnotes.xml.rels')
+
+# Book search cache (bounded in-process memo backed by SQLite in the temp
+# dir); both layers honor the TTLs below
+LOOKUP_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'citation_processor_cache.db')
+LOOKUP_CACHE_TTL = 30 * 24 * 3600      # Seconds a found result stays fresh
+LOOKUP_CACHE_MISS_TTL = 24 * 3600      # Seconds a "no results" entry stays fresh
+LOOKUP_MEMO_SIZE = 4096               # Entries kept in the in-process memo
+_LOOKUP_MEMO = {}                      # key -> (ts, results), oldest first
+_memo_lock = threading.Lock()
+_cache_ready = False
+MAX_QUERY_LENGTH = 120                 # Characters of a search query sent to the API
+
+# Google Books session: keep-alive connection pool with a short, bounded
+# retry on throttling and transient server errors. Retries are mounted for
+# the API host only, and read timeouts are not retried, so a lookup stays well
+# inside the gunicorn worker timeout
+LOOKUP_TIMEOUT = 5                     # Seconds per Google Books request
+_SESSION = requests.Session()
+_SESSION.mount('https://www.googleapis.com/', HTTPAdapter(
+    pool_connections=16, pool_maxsize=16, max_retries=Retry(
+        total=2, read=0, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True, retry_after_max=3)))
+
+# Page scraping session for user-supplied URLs: connection reuse only. No
+# retries (a failed fetch falls back to the heuristic title) and no cookie
+# persistence, since one session serves arbitrary sites for every user
+_SCRAPE_SESSION = requests.Session()
+_SCRAPE_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+_SCRAPE_SESSION.mount('https://', _SCRAPE_ADAPTER)
+_SCRAPE_SESSION.mount('http://', _SCRAPE_ADAPTER)
+_SCRAPE_SESSION.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+# WordprocessingML / OPC namespaces used when walking endnotes.xml with lxml
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+def _w(tag):
+    """Clark-notation name for a w: element or attribute"""
+    return f'{{{W_NS}}}{tag}'
+
+# Precompiled patterns used on the per-note hot paths
+_RE_DIGITS = re.compile(r'\d+')
+_RE_LEADING_NUM = re.compile(r'^\s*\d+\.?\s*')
+# Trailing number and/or page reference ("…, 1999, pp. 3-4."), matched in one
+# pass; the shared ",?\s*" prefix is factored out so each start position is
+# tried once. Equivalent to the former page-then-number subs for newline-free
+# text (Word run text); "$" also matches before a final newline, so text with
+# embedded newlines can be trimmed differently
+_RE_TRAILING_REF = re.compile(r',?\s*(?:\d+\.?(?:,?\s*pp?\.?\s*\d+(?:-\d+)?\.?)?|pp?\.?\s*\d+(?:-\d+)?\.?)$')
+_RE_URL_PREFIX = re.compile(r'^(http|www\.)', re.IGNORECASE)
+_RE_TITLE = re.compile(r'<title>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+_RE_TITLE_SUFFIX = re.compile(r' \| .*$')
+# Interstitial/error page titles that must not be used as a citation title,
+# matched in a single pass instead of one substring scan per phrase
+BLOCKED_TITLE_PHRASES = ("Just a moment", "Access Denied", "Error", "404")
+_RE_BLOCKED_TITLE = re.compile('|'.join(map(re.escape, BLOCKED_TITLE_PHRASES)))
+_RE_HTML_TOKEN = re.compile(r'(<a href="[^"]+">.*?</a>|<em>.*?</em>)')
+_RE_ANCHOR = re.compile(r'<a href="([^"]+)">(.*?)</a>')
+
 # ==================== RELATIONSHIP MANAGER ====================
 class RelationshipManager:
     """Handles adding URLs to word/_rels/endnotes.xml.rels"""
@@ -66,26 +138,26 @@ class RelationshipManager:
         self.rels_path = os.path.join(self.rels_dir, 'endnotes.xml.rels')
         self.relationships = []
         self.next_id = 1
+        self._dirty = False
         self._load()
 
     def _load(self):
         if not os.path.exists(self.rels_dir):
             os.makedirs(self.rels_dir)
         if os.path.exists(self.rels_path):
-            with open(self.rels_path, 'r', encoding='utf-8') as f:
-                dom = minidom.parseString(f.read())
-                for rel in dom.getElementsByTagName('Relationship'):
-                    rid = rel.getAttribute('Id')
-                    match = re.search(r'\d+', rid)
-                    if match:
-                        num_id = int(match.group())
-                        self.next_id = max(self.next_id, num_id + 1)
-                    self.relationships.append({
-                        'Id': rid,
-                        'Type': rel.getAttribute('Type'),
-                        'Target': rel.getAttribute('Target'),
-                        'TargetMode': rel.getAttribute('TargetMode')
-                    })
+            root = etree.parse(self.rels_path).getroot()
+            for rel in root.iter(f'{{{PKG_REL_NS}}}Relationship'):
+                rid = rel.get('Id', '')
+                match = _RE_DIGITS.search(rid)
+                if match:
+                    num_id = int(match.group())
+                    self.next_id = max(self.next_id, num_id + 1)
+                self.relationships.append({
+                    'Id': rid,
+                    'Type': rel.get('Type', ''),
+                    'Target': rel.get('Target', ''),
+                    'TargetMode': rel.get('TargetMode', '')
+                })
 
     def get_or_create_hyperlink(self, url):
         """Returns the rId for a URL, creating a new Relationship if needed"""
@@ -100,35 +172,31 @@ class RelationshipManager:
             'Target': url,
             'TargetMode': "External"
         })
-        self._save()
+        self._dirty = True
         return new_id
 
+    def flush(self):
+        """Write the relationships file once if any hyperlink was added"""
+        if self._dirty:
+            self._save()
+            self._dirty = False
+
     def _save(self):
         """Save relationships file with proper XML formatting"""
-        impl = minidom.getDOMImplementation()
-        doc = impl.createDocument(None, None, None)
-        
         # Create root element with namespace
-        rels_elem = doc.createElement('Relationships')
-        rels_elem.setAttribute('xmlns', "http://schemas.openxmlformats.org/package/2006/relationships")
-        doc.appendChild(rels_elem)
+        rels_elem = etree.Element(f'{{{PKG_REL_NS}}}Relationships', nsmap={None: PKG_REL_NS})
         
         # Add all relationships
         for rel in self.relationships:
-            node = doc.createElement('Relationship')
-            node.setAttribute('Id', rel['Id'])
-            node.setAttribute('Type', rel['Type'])
-            node.setAttribute('Target', rel['Target'])
+            node = etree.SubElement(rels_elem, f'{{{PKG_REL_NS}}}Relationship')
+            node.set('Id', rel['Id'])
+            node.set('Type', rel['Type'])
+            node.set('Target', rel['Target'])
             if rel.get('TargetMode'):
-                node.setAttribute('TargetMode', rel['TargetMode'])
-            rels_elem.appendChild(node)
+                node.set('TargetMode', rel['TargetMode'])
         
-        # Write with proper XML declaration
-        with open(self.rels_path, 'w', encoding='utf-8') as f:
-            # Write XML declaration manually to match Word's format
-            f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n')
-            # Write the rest without the XML declaration
-            f.write(rels_elem.toxml())
+        # Serialize straight to the file with the declaration Word expects
+        etree.ElementTree(rels_elem).write(self.rels_path, xml_declaration=True, encoding='UTF-8', standalone=True)
 
 # ==================== BACKEND LOGIC ====================
 
@@ -143,21 +211,21 @@ def clean_search_term(text):
         return text
     
     # For non-URLs, clean up book citation formatting
-    text = re.sub(r'^\s*\d+\.?\s*', '', text)  # Remove leading numbers
-    text = re.sub(r',?\s*pp?\.?\s*\d+(-\d+)?\.?$', '', text)  # Remove page numbers
-    text = re.sub(r',?\s*\d+\.?$', '', text)  # Remove trailing numbers
+    # Cheap prefix/suffix checks let the common case skip the regex engine
+    if text[:1].isspace() or text[:1].isdigit():
+        text = _RE_LEADING_NUM.sub('', text)  # Remove leading numbers
+    if text[-1:].isdigit() or text.endswith('.'):
+        text = _RE_TRAILING_REF.sub('', text, count=1)  # Remove page and trailing numbers
     return text.strip()
 
 def get_agency_name(domain):
     """Returns the official agency name based on the domain."""
-    # Handle subdomains by checking the main domain
-    parts = domain.split('.')
-    
     # Try the full domain first (for special cases)
     if domain in GOV_AGENCY_MAP:
         return GOV_AGENCY_MAP[domain]
     
-    # Then try the root domain (last two parts)
+    # Then handle subdomains by trying the root domain (last two parts)
+    parts = domain.rsplit('.', 2)
     if len(parts) >= 2:
         root_domain = f"{parts[-2]}.{parts[-1]}"
         if root_domain in GOV_AGENCY_MAP:
@@ -174,8 +242,8 @@ def get_agency_name(domain):
 def get_heuristic_title(url):
     """Generates a title from the URL slug if scraping fails."""
     parsed_uri = urlparse(url)
-    path = parsed_uri.path
-    slug = [s for s in path.split('/') if s][-1] if path.split('/') else ''
+    # Last non-empty path segment, without splitting the whole path
+    slug = parsed_uri.path.rstrip('/').rpartition('/')[2]
     
     clean_filename = unquote(slug).replace('_', ' ').replace('-', ' ').title()
     
@@ -212,16 +280,15 @@ def fetch_web_metadata(url):
         }
         
         try:
-            s = requests.Session()
-            response = s.get(url, headers=headers, timeout=7, allow_redirects=True)
+            response = _SCRAPE_SESSION.get(url, headers=headers, timeout=7, allow_redirects=True)
             
             if response.status_code == 200:
                 # Scrape <title>
-                title_match = re.search(r'<title>(.*?)</title>', response.text, re.IGNORECASE | re.DOTALL)
+                title_match = _RE_TITLE.search(response.text)
                 if title_match:
                     raw_title = title_match.group(1).strip()
-                    if not any(block_word in raw_title for block_word in ["Just a moment", "Access Denied", "Error", "404"]):
-                         page_title = re.sub(r' \| .*$', '', raw_title).strip()
+                    if not _RE_BLOCKED_TITLE.search(raw_title):
+                         page_title = _RE_TITLE_SUFFIX.sub('', raw_title).strip()
                          
                 # Scrape Last Modified/Published Date from headers 
                 if 'Last-Modified' in response.headers:
@@ -259,28 +326,99 @@ def fetch_web_metadata(url):
             'id': 'web_result_failed'
         }]
 
-def query_google_books(query):
-    url_pattern = re.compile(r'^(http|www\.)', re.IGNORECASE)
-    if url_pattern.match(query): return fetch_web_metadata(query)
-    api_url = "https://www.googleapis.com/books/v1/volumes"
-    params = {'q': query, 'maxResults': 4, 'printType': 'books'}
+def _cache_connect():
+    global _cache_ready
+    conn = sqlite3.connect(LOOKUP_CACHE_PATH, timeout=5)
+    if not _cache_ready:
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS citations (key TEXT PRIMARY KEY, json TEXT, ts INTEGER)')
+        except sqlite3.Error:
+            conn.close()
+            raise
+        _cache_ready = True
+    return conn
+
+def _is_fresh(entry):
+    """True if a (ts, results) cache entry is still within its TTL"""
+    ts, results = entry
+    # Empty results ("no doc found") are cached too, but expire sooner
+    ttl = LOOKUP_CACHE_TTL if results else LOOKUP_CACHE_MISS_TTL
+    return time.time() - ts <= ttl
+
+def _cache_get(key):
+    """Returns the (ts, results) entry for key from the in-process memo or disk"""
+    with _memo_lock:
+        entry = _LOOKUP_MEMO.pop(key, None)
+        if entry is not None:
+            _LOOKUP_MEMO[key] = entry  # Re-insert as most recently used
+            return entry
     try:
-        r = requests.get(api_url, params=params)
-        data = r.json()
-        results = []
-        if 'items' in data:
-            for item in data['items']:
-                info = item.get('volumeInfo', {})
-                results.append({
-                    'type': 'book',
-                    'title': info.get('title', 'Unknown Title'),
-                    'authors': info.get('authors', ['Unknown']),
-                    'publisher': info.get('publisher', ''),
-                    'city': '', 
-                    'year': info.get('publishedDate', '')[:4],
-                    'id': item['id']
-                })
-        return results
+        with closing(_cache_connect()) as conn:
+            row = conn.execute('SELECT json, ts FROM citations WHERE key = ?', (key,)).fetchone()
+    except sqlite3.Error:
+        return None
+    if not row: return None
+    entry = (row[1], json.loads(row[0]))
+    _memo_put(key, entry)
+    return entry
+
+def _memo_put(key, entry):
+    with _memo_lock:
+        _LOOKUP_MEMO.pop(key, None)
+        _LOOKUP_MEMO[key] = entry
+        while len(_LOOKUP_MEMO) > LOOKUP_MEMO_SIZE:
+            del _LOOKUP_MEMO[next(iter(_LOOKUP_MEMO))]  # Evict least recently used
+
+def _cache_put(key, results):
+    entry = (int(time.time()), results)
+    _memo_put(key, entry)
+    try:
+        with closing(_cache_connect()) as conn:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO citations (key, json, ts) VALUES (?, ?, ?)',
+                             (key, json.dumps(results), entry[0]))
+    except sqlite3.Error:
+        pass  # The disk cache is best-effort; a read-only temp dir must not break lookups
+
+def _search_books(key):
+    entry = _cache_get(key)
+    if entry is not None and _is_fresh(entry): return entry[1]
+    api_url = "https://www.googleapis.com/books/v1/volumes"
+    params = {'q': key, 'maxResults': 4, 'printType': 'books',
+              # Partial response: only the volume fields read below
+              'fields': 'items(id,volumeInfo(title,authors,publisher,publishedDate))'}
+    r = _SESSION.get(api_url, params=params, timeout=LOOKUP_TIMEOUT)
+    r.raise_for_status()  # Never cache an error response as "no results"
+    data = r.json()
+    results = []
+    if 'items' in data:
+        for item in data['items']:
+            info = item.get('volumeInfo', {})
+            results.append({
+                'type': 'book',
+                'title': info.get('title', 'Unknown Title'),
+                'authors': info.get('authors', ['Unknown']),
+                'publisher': info.get('publisher', ''),
+                'city': '', 
+                'year': info.get('publishedDate', '')[:4],
+                'id': item['id']
+            })
+    _cache_put(key, results)
+    return results
+
+def _should_lookup(query):
+    """True if the query has enough alphanumeric content to be worth a search"""
+    return sum(ch.isalnum() for ch in query) >= 3
+
+def query_google_books(query):
+    if _RE_URL_PREFIX.match(query): return fetch_web_metadata(query)
+    key = ' '.join(query.lower().split())
+    # Hopeless queries (punctuation, stray numbers) never hit the network, and
+    # long raw endnote text is capped since it would not match anyway
+    if not _should_lookup(key): return []
+    key = key[:MAX_QUERY_LENGTH].rstrip()
+    try: return _search_books(key)
     except: return []
 
 def extract_endnotes_xml(user_data):
@@ -289,82 +427,83 @@ def extract_endnotes_xml(user_data):
     into simple HTML for the editor, preserving original link targets.
     """
     if not user_data or not user_data['endnotes_file']: return []
-    with open(user_data['endnotes_file'], 'r', encoding='utf-8') as f:
-        dom = minidom.parseString(f.read())
-    
     notes = []
     
     # Find the relationships file path (needed to resolve existing hyperlinks)
     rels_path = os.path.join(user_data['extract_dir'], 'word', '_rels', 'endnotes.xml.rels')
     relationships = {}
     if os.path.exists(rels_path):
-        rels_dom = minidom.parse(rels_path)
-        for rel in rels_dom.getElementsByTagName('Relationship'):
-            if rel.getAttribute('Type').endswith('/hyperlink'):
-                relationships[rel.getAttribute('Id')] = rel.getAttribute('Target')
+        rels_root = etree.parse(rels_path).getroot()
+        for rel in rels_root.iter(f'{{{PKG_REL_NS}}}Relationship'):
+            if rel.get('Type', '').endswith('/hyperlink'):
+                relationships[rel.get('Id')] = rel.get('Target')
 
-    for en in dom.getElementsByTagName('w:endnote'):
-        en_id = en.getAttribute('w:id')
+    # Stream endnotes instead of building the whole tree
+    for _, en in etree.iterparse(user_data['endnotes_file'], events=('end',), tag=_w('endnote')):
+        en_id = en.get(_w('id'))
         if en_id and en_id not in ['-1', '0']:
             html_parts = []
             full_text_parts = []
             
-            p = en.getElementsByTagName('w:p')[0]
+            p = en.find('.//' + _w('p'))
             
             # --- Iterate through direct children of the paragraph ---
-            for node in p.childNodes:
+            for node in p:
                 
-                if node.nodeType == node.ELEMENT_NODE:
+                # Case 1: Existing Hyperlink (<w:hyperlink>)
+                if node.tag == _w('hyperlink'):
+                    r_id = node.get(f'{{{R_NS}}}id')
+                    url = relationships.get(r_id, '#') # Get original URL target
                     
-                    # Case 1: Existing Hyperlink (<w:hyperlink>)
-                    if node.tagName == 'w:hyperlink':
-                        r_id = node.getAttribute('r:id')
-                        url = relationships.get(r_id, '#') # Get original URL target
-                        
-                        # Extract the text content from the runs inside the hyperlink
-                        link_text = ""
-                        for run in node.getElementsByTagName('w:r'):
-                            text = "".join([t.firstChild.nodeValue for t in run.getElementsByTagName('w:t') if t.firstChild])
-                            link_text += text
-                            full_text_parts.append(text)
-                            
-                        # Convert to HTML anchor tag
-                        html_parts.append(f'<a href="{url}">{link_text}</a>')
-                        continue
-
-                    # Case 2: Standard Run (<w:r>) (for plain text, spaces, or italics)
-                    if node.tagName == 'w:r':
-                        # Check for Endnote Marker and skip it
-                        if node.getElementsByTagName('w:endnoteRef'): continue
-                        
-                        text = "".join([t.firstChild.nodeValue for t in node.getElementsByTagName('w:t') if t.firstChild])
-                        if not text: continue
+                    # Extract the text content from the runs inside the hyperlink
+                    link_parts = []
+                    for run in node.iter(_w('r')):
+                        text = "".join([t.text for t in run.iter(_w('t')) if t.text])
+                        link_parts.append(text)
                         full_text_parts.append(text)
                         
-                        # Check Italics
-                        rPr = node.getElementsByTagName('w:rPr')
-                        is_italic = False
-                        if rPr and rPr[0].getElementsByTagName('w:i'): is_italic = True
-                        
-                        if is_italic: html_parts.append(f"<em>{text}</em>")
-                        else: html_parts.append(text)
+                    # Convert to HTML anchor tag
+                    html_parts.append(f'<a href="{url}">{"".join(link_parts)}</a>')
+                    continue
+
+                # Case 2: Standard Run (<w:r>) (for plain text, spaces, or italics)
+                if node.tag == _w('r'):
+                    # Check for Endnote Marker and skip it
+                    if node.find('.//' + _w('endnoteRef')) is not None: continue
+                    
+                    text = "".join([t.text for t in node.iter(_w('t')) if t.text])
+                    if not text: continue
+                    full_text_parts.append(text)
+                    
+                    # Check Italics
+                    rPr = node.find('.//' + _w('rPr'))
+                    is_italic = rPr is not None and rPr.find('.//' + _w('i')) is not None
+                    
+                    if is_italic: html_parts.append(f"<em>{text}</em>")
+                    else: html_parts.append(text)
             
             final_html = "".join(html_parts).strip()
             clean_term = clean_search_term("".join(full_text_parts).strip())
             notes.append({'id': en_id, 'html': final_html, 'clean_term': clean_term})
+        
+        # Free the processed endnote and any earlier siblings so peak memory
+        # stays at roughly one endnote
+        en.clear()
+        while en.getprevious() is not None:
+            del en.getparent()[0]
             
     return sorted(notes, key=lambda x: int(x['id']))
 
 def write_updated_note(user_data, note_id, html_content):
     if not user_data: return
     path = user_data['endnotes_file']
-    dom = minidom.parse(str(path))
-    rel_mgr = RelationshipManager(user_data['extract_dir'])
+    tree = etree.parse(str(path))
+    rel_mgr = None  # Loaded on the first hyperlink, written once at the end
     
-    for en in dom.getElementsByTagName('w:endnote'):
-        if en.getAttribute('w:id') == str(note_id):
+    for en in tree.getroot().iter(_w('endnote')):
+        if en.get(_w('id')) == str(note_id):
             # Get all paragraphs in this endnote
-            paragraphs = en.getElementsByTagName('w:p')
+            paragraphs = list(en.iter(_w('p')))
             
             # Work with the first paragraph (main content)
             if paragraphs:
@@ -372,155 +511,143 @@ def write_updated_note(user_data, note_id, html_content):
                 
                 # Find and preserve the endnote reference run
                 ref_run = None
-                for run in p.getElementsByTagName('w:r'):
-                    if run.getElementsByTagName('w:endnoteRef'):
-                        ref_run = run.cloneNode(deep=True)  # Clone to preserve all properties
+                for run in p.iter(_w('r')):
+                    if run.find('.//' + _w('endnoteRef')) is not None:
+                        ref_run = copy.deepcopy(run)  # Clone to preserve all properties
                         break
                 
                 # Clear the paragraph content but keep the paragraph element
-                while p.hasChildNodes(): 
-                    p.removeChild(p.firstChild)
+                for child in list(p):
+                    p.remove(child)
+                p.text = None
                 
                 # Re-add paragraph properties with EndnoteText style
-                pPr = dom.createElement('w:pPr')
-                pStyle = dom.createElement('w:pStyle')
-                pStyle.setAttribute('w:val', 'EndnoteText')
-                pPr.appendChild(pStyle)
-                p.appendChild(pPr)
+                pPr = etree.SubElement(p, _w('pPr'))
+                etree.SubElement(pPr, _w('pStyle'), {_w('val'): 'EndnoteText'})
                 
                 # Re-add the endnote reference with proper style
-                if ref_run:
+                if ref_run is not None:
                     # Ensure the reference has the proper style
-                    rPr_elements = ref_run.getElementsByTagName('w:rPr')
+                    rPr_elements = list(ref_run.iter(_w('rPr')))
                     if not rPr_elements:
-                        rPr = dom.createElement('w:rPr')
-                        rStyle = dom.createElement('w:rStyle')
-                        rStyle.setAttribute('w:val', 'EndnoteReference')
-                        rPr.appendChild(rStyle)
-                        ref_run.insertBefore(rPr, ref_run.firstChild)
+                        rPr = etree.Element(_w('rPr'))
+                        etree.SubElement(rPr, _w('rStyle'), {_w('val'): 'EndnoteReference'})
+                        ref_run.insert(0, rPr)
                     else:
                         # Check if EndnoteReference style exists
                         has_style = False
                         for rPr in rPr_elements:
-                            if rPr.getElementsByTagName('w:rStyle'):
+                            if rPr.find('.//' + _w('rStyle')) is not None:
                                 has_style = True
                                 break
-                        if not has_style and rPr_elements:
-                            rStyle = dom.createElement('w:rStyle')
-                            rStyle.setAttribute('w:val', 'EndnoteReference')
-                            rPr_elements[0].appendChild(rStyle)
+                        if not has_style:
+                            etree.SubElement(rPr_elements[0], _w('rStyle'), {_w('val'): 'EndnoteReference'})
                     
-                    p.appendChild(ref_run)
+                    p.append(ref_run)
                     
                     # Add space after endnote reference
-                    r = dom.createElement('w:r')
-                    t = dom.createElement('w:t')
-                    t.setAttribute('xml:space', 'preserve')
-                    t.appendChild(dom.createTextNode(" "))
-                    r.appendChild(t)
-                    p.appendChild(r)
+                    r = etree.SubElement(p, _w('r'))
+                    t = etree.SubElement(r, _w('t'), {XML_SPACE: 'preserve'})
+                    t.text = " "
                 
-                # Parse and add the HTML content
-                tokens = re.split(r'(<a href="[^"]+">.*?</a>|<em>.*?</em>)', html_content)
+                # Parse and add the HTML content; entities are unescaped once up
+                # front (they never span a tag boundary) rather than per token
+                html_content = html_content.replace('&nbsp;', ' ').replace('&amp;', '&')
+                tokens = _RE_HTML_TOKEN.split(html_content) if '<' in html_content else [html_content]
                 
                 for token in tokens:
                     if not token: continue
-                    token = token.replace('&nbsp;', ' ').replace('&amp;', '&')
                     
                     # Case 1: Hyperlink
                     if token.startswith('<a href='):
-                        match = re.match(r'<a href="([^"]+)">(.*?)</a>', token)
+                        match = _RE_ANCHOR.match(token)
                         if match:
                             url = match.group(1)
                             text = match.group(2)
                             
+                            if rel_mgr is None:
+                                rel_mgr = RelationshipManager(user_data['extract_dir'])
                             r_id = rel_mgr.get_or_create_hyperlink(url)
                             
-                            hlink = dom.createElement('w:hyperlink')
-                            hlink.setAttribute('r:id', r_id)
+                            hlink = etree.SubElement(p, _w('hyperlink'), {f'{{{R_NS}}}id': r_id})
                             
-                            run = dom.createElement('w:r')
-                            rPr = dom.createElement('w:rPr')
+                            run = etree.SubElement(hlink, _w('r'))
+                            rPr = etree.SubElement(run, _w('rPr'))
                             
                             # Add Hyperlink style
-                            rStyle = dom.createElement('w:rStyle')
-                            rStyle.setAttribute('w:val', 'Hyperlink')
-                            rPr.appendChild(rStyle)
+                            etree.SubElement(rPr, _w('rStyle'), {_w('val'): 'Hyperlink'})
                             
                             # Add blue color
-                            color = dom.createElement('w:color')
-                            color.setAttribute('w:val', '0000FF')
-                            rPr.appendChild(color)
+                            etree.SubElement(rPr, _w('color'), {_w('val'): '0000FF'})
                             
                             # Add underline
-                            u = dom.createElement('w:u')
-                            u.setAttribute('w:val', 'single')
-                            rPr.appendChild(u)
-                            
-                            run.appendChild(rPr)
-                            t = dom.createElement('w:t')
-                            t.appendChild(dom.createTextNode(text))
-                            run.appendChild(t)
-                            
-                            hlink.appendChild(run)
-                            p.appendChild(hlink)
+                            etree.SubElement(rPr, _w('u'), {_w('val'): 'single'})
                             
-                            # Save relationships immediately
-                            rel_mgr._save()
+                            t = etree.SubElement(run, _w('t'))
+                            t.text = text
                             continue
                     
                     # Case 2: Regular text (italic or plain)
-                    run = dom.createElement('w:r')
-                    rPr = dom.createElement('w:rPr')
+                    run = etree.SubElement(p, _w('r'))
+                    rPr = etree.SubElement(run, _w('rPr'))
                     
                     # Always use Times New Roman for consistency
-                    rFonts = dom.createElement('w:rFonts')
-                    rFonts.setAttribute('w:ascii', 'Times New Roman')
-                    rFonts.setAttribute('w:hAnsi', 'Times New Roman')
-                    rPr.appendChild(rFonts)
-                    
-                    run.appendChild(rPr)
+                    etree.SubElement(rPr, _w('rFonts'), {_w('ascii'): 'Times New Roman', _w('hAnsi'): 'Times New Roman'})
                     
                     text_content = token
                     if token.startswith('<em>'):
                         # Extract italic text
                         text_content = token[4:-5]
                         # Add italic formatting
-                        i_elem = dom.createElement('w:i')
-                        run.getElementsByTagName('w:rPr')[0].appendChild(i_elem)
+                        etree.SubElement(rPr, _w('i'))
                     
-                    t = dom.createElement('w:t')
+                    t = etree.SubElement(run, _w('t'))
                     # Preserve spaces
                     if text_content.startswith(' ') or text_content.endswith(' '):
-                        t.setAttribute('xml:space', 'preserve')
-                    t.appendChild(dom.createTextNode(text_content))
-                    run.appendChild(t)
-                    p.appendChild(run)
+                        t.set(XML_SPACE, 'preserve')
+                    t.text = text_content
             
             # Ensure any additional empty paragraphs have EndnoteText style
-            for para_idx in range(1, len(paragraphs)):
-                para = paragraphs[para_idx]
+            for para in paragraphs[1:]:
                 # Check if paragraph has the style
                 has_style = False
-                for pPr in para.getElementsByTagName('w:pPr'):
-                    if pPr.getElementsByTagName('w:pStyle'):
+                for pPr in para.iter(_w('pPr')):
+                    if pPr.find('.//' + _w('pStyle')) is not None:
                         has_style = True
                         break
                 
                 if not has_style:
-                    # Add EndnoteText style
-                    pPr = dom.createElement('w:pPr')
-                    pStyle = dom.createElement('w:pStyle')
-                    pStyle.setAttribute('w:val', 'EndnoteText')
-                    pPr.appendChild(pStyle)
-                    # Insert at the beginning of the paragraph
-                    if para.firstChild:
-                        para.insertBefore(pPr, para.firstChild)
-                    else:
-                        para.appendChild(pPr)
+                    # Add EndnoteText style, inserted at the beginning of the paragraph
+                    pPr = etree.Element(_w('pPr'))
+                    etree.SubElement(pPr, _w('pStyle'), {_w('val'): 'EndnoteText'})
+                    para.insert(0, pPr)
+            break
                 
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write(dom.toxml())
+    # Relationships first: endnotes.xml must never reference an r:id that
+    # is not on disk yet
+    if rel_mgr is not None:
+        rel_mgr.flush()
+    tree.write(path, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+def pack_docx_delta(input_path, output_path, overrides):
+    """
+    Writes output_path as a copy of the input_path zip, replacing the members
+    named in overrides ({arcname: bytes}). Untouched members are read from the
+    original archive and re-written with their original compression type
+    (zipfile has no public raw copy, so DEFLATED members are still
+    recompressed); the saving is not having to unpack them to disk first.
+    """
+    with zipfile.ZipFile(input_path, 'r') as src, zipfile.ZipFile(output_path, 'w') as out:
+        for info in src.infolist():
+            if info.filename in overrides:
+                out.writestr(info, overrides[info.filename], compress_type=zipfile.ZIP_DEFLATED, compresslevel=6)
+            else:
+                out.writestr(info, src.read(info.filename))
+        # Parts created during editing (e.g. a new endnotes rels file)
+        existing = set(src.namelist())
+        for name, data in overrides.items():
+            if name not in existing:
+                out.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED, compresslevel=6)
 
 # ==================== ROUTES ====================
 @app.route('/')
@@ -544,10 +671,16 @@ def upload():
         input_path = os.path.join(temp_dir, 'source.docx')
         file.save(input_path)
         extract_dir = os.path.join(temp_dir, 'extracted')
-        with zipfile.ZipFile(input_path, 'r') as z: z.extractall(extract_dir)
+        # Only the parts the editor touches are unpacked; download() copies
+        # every other member straight from source.docx
+        with zipfile.ZipFile(input_path, 'r') as z:
+            names = set(z.namelist())
+            for part in EDITABLE_PARTS:
+                if part in names: z.extract(part, extract_dir)
         endnotes_file = os.path.join(extract_dir, 'word', 'endnotes.xml')
         USER_DATA_STORE[user_id] = {
             'temp_dir': temp_dir,
+            'source_file': input_path,
             'extract_dir': extract_dir,
             'endnotes_file': endnotes_file,
             'original_filename': original_filename
@@ -585,11 +718,12 @@ def download():
     user_data = get_user_data()
     if not user_data: return "Session expired", 400
     output = os.path.join(user_data['temp_dir'], f"Resolved_{user_data['original_filename']}")
-    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as z:
-        for root, dirs, files in os.walk(user_data['extract_dir']):
-            for file in files:
-                p = os.path.join(root, file)
-                z.write(p, os.path.relpath(p, user_data['extract_dir']))
+    overrides = {}
+    for part in EDITABLE_PARTS:
+        p = os.path.join(user_data['extract_dir'], *part.split('/'))
+        if os.path.exists(p):
+            with open(p, 'rb') as f: overrides[part] = f.read()
+    pack_docx_delta(user_data['source_file'], output, overrides)
     return send_file(output, as_attachment=True)
 
 if __name__ == '__main__':